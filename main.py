@@ -1,33 +1,82 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
-# @Project ：pythonProject 
+# @Project ：pythonProject
 # @File    ：main.py
 # @Author  ：Swift
 # @Date    ：2024/9/29 15:45
 
+import asyncio
+import hashlib
 import logging
 import os
-import requests
-import json
-from flask import Flask, request, jsonify
+import queue
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import httpx
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel
+from redis import asyncio as aioredis
 from dotenv import load_dotenv
 
 # 加载 .env 文件中的环境变量
 load_dotenv()
 
-app = Flask(__name__)
 
-# 日志配置
+@asynccontextmanager
+async def lifespan(app):
+    # 启动时预热上游连接，首个真实请求不用再付 TCP+TLS 握手
+    await warm_up_connections()
+    yield
+    # 应用关闭时释放连接池并刷出剩余日志
+    await CLIENT.aclose()
+    if SESSION_REDIS is not None:
+        await SESSION_REDIS.aclose()
+    LOG_LISTENER.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class SSEAwareGZipMiddleware(GZipMiddleware):
+    """
+    跳过 SSE 路由的压缩：按块 gzip 不 flush 会把整个流憋在压缩器里，
+    客户端要等流结束才一次性收到，流式就退化成了缓冲。
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/chat/stream":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# 压缩大响应（长对话历史可达几十 KB），小响应不压缩省 CPU
+app.add_middleware(SSEAwareGZipMiddleware, minimum_size=512, compresslevel=1)
+
+# 日志配置：请求路径只把记录放进内存队列，磁盘和终端写入由后台线程完成
 log_file = os.getenv('LOG_FILE', 'app.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s:%(levelname)s:%(message)s',
-    handlers=[
-        logging.FileHandler(log_file),  # 写入日志文件
-        logging.StreamHandler()  # 输出到标准输出
-    ]
-)
+log_queue = queue.Queue(-1)
+log_formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(message)s')
+file_handler = RotatingFileHandler(log_file, maxBytes=50_000_000, backupCount=5)  # 写入日志文件
+stream_handler = logging.StreamHandler()  # 输出到标准输出
+file_handler.setFormatter(log_formatter)
+stream_handler.setFormatter(log_formatter)
+# 不用 basicConfig，避免给 QueueHandler 附加默认 formatter 造成重复格式化
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(QueueHandler(log_queue))
+LOG_LISTENER = QueueListener(log_queue, file_handler, stream_handler)
+LOG_LISTENER.start()
 
 # 获取 API keys
 gemini_key = os.getenv("GEMINI_KEY")
@@ -43,14 +92,196 @@ if not gemini_key or not yi_key:
 
 # 默认角色和模型
 default_role = """
-Role: You are a knowledgeable travel guide and planner. 
-Your task is to help clients plan their trips to any location worldwide. 
-When engaging with clients, ask them for more details if the information they provide is insufficient for planning the itinerary. 
-Gather essential details such as their travel dates, preferred destinations, interests (e.g., culture, adventure, relaxation), 
+Role: You are a knowledgeable travel guide and planner.
+Your task is to help clients plan their trips to any location worldwide.
+When engaging with clients, ask them for more details if the information they provide is insufficient for planning the itinerary.
+Gather essential details such as their travel dates, preferred destinations, interests (e.g., culture, adventure, relaxation),
 budget, and any special requests. Your responses should be friendly, informative, and proactive in guiding them through the planning process.
 """
 default_model = "gemini-1.0-pro-latest"
 
+# 预先拼好默认角色前缀，避免每轮重新扫描和拼接这 ~500 字符
+default_role_prefix = default_role + "\n"
+
+# 上游 API 的 URL 和请求头在导入时构建一次，请求路径不再重建
+# Gemini key 放在 x-goog-api-key 头里而不是 URL 查询串，避免泄漏到日志
+GOOGLE_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{default_model}:generateContent"
+GOOGLE_HEADERS = {
+    'Content-Type': 'application/json',
+    'x-goog-api-key': gemini_key
+}
+YI_URL = "https://api.lingyiwanwu.com/v1/chat/completions"
+YI_HEADERS = {
+    'Content-Type': 'application/json',
+    'Authorization': f'Bearer {yi_key}'  # 从环境变量中获取 YI_KEY
+}
+
+# 复用异步 HTTP 连接池，所有上游 LLM 调用共享一个事件循环
+# http2=True：多个在途请求复用同一条 TLS 连接，不再一个请求占一个 socket
+# 注意：显式传了 transport 时，客户端层的 http2=/limits= 会被忽略，
+# 所以这些配置必须放在 transport 上
+CLIENT = httpx.AsyncClient(
+    timeout=httpx.Timeout(60, connect=3.05),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    ),
+)
+
+# 限制同时在途的上游调用数，避免高并发时触发提供商的 RPM 限流
+MAX_UPSTREAM_CONCURRENCY = int(os.getenv("MAX_UPSTREAM_CONCURRENCY", "16"))
+UPSTREAM_SEMAPHORE = asyncio.Semaphore(MAX_UPSTREAM_CONCURRENCY)
+
+# 按提示内容哈希缓存模型回复，相同提示直接命中缓存，不再重复调用付费 API
+RESPONSE_CACHE = TTLCache(maxsize=10_000, ttl=3600)
+
+# 服务端会话存储：客户端只传 session_id 和新消息，不用每轮回传整个历史
+# 多 worker 部署必须配 REDIS_URL 跨进程共享，否则会话会随机落在不同 worker 上丢历史；
+# 未配置时退回进程内 TTLCache，只适合单 worker / 本地调试
+SESSION_TTL = 24 * 3600
+REDIS_URL = os.getenv("REDIS_URL")
+SESSION_REDIS = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+SESSION_STORE = TTLCache(maxsize=10_000, ttl=SESSION_TTL)
+if SESSION_REDIS is None:
+    logging.warning("REDIS_URL not set, sessions are stored in-process; "
+                    "run a single worker or set REDIS_URL.")
+
+
+async def load_session(session_id):
+    """
+    读取会话历史，没有则返回空列表。
+    """
+    if SESSION_REDIS is not None:
+        raw = await SESSION_REDIS.get(f"chat:{session_id}")
+        return orjson.loads(raw) if raw else []
+    return SESSION_STORE.get(session_id) or []
+
+
+async def save_session(session_id, history):
+    """
+    写回会话历史并刷新 TTL。
+    """
+    if SESSION_REDIS is not None:
+        await SESSION_REDIS.setex(f"chat:{session_id}", SESSION_TTL, orjson.dumps(history))
+    else:
+        SESSION_STORE[session_id] = history
+
+
+class ChatRequest(BaseModel):
+    """
+    /chat 和 /chat/stream 的请求体。畸形输入在进入处理逻辑前
+    就被一次编译好的校验挡下并返回 422。
+    """
+    message: str = ""
+    role: str = default_role
+    conversation_history: list[str] = []
+    session_id: str | None = None
+
+    def use_session(self):
+        # 区分「没传 session_id」和「显式传了 null 要开新会话」
+        return 'session_id' in self.model_fields_set
+
+
+class CircuitBreaker:
+    """
+    简单的熔断器：连续失败 fail_max 次后打开，打开期间直接拒绝请求，
+    reset_timeout 秒后放行一次试探请求（半开）。
+    """
+
+    def __init__(self, name, fail_max=5, reset_timeout=30):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.fail_count = 0
+        self.opened_at = None
+
+    def is_open(self):
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # 半开：放行一次试探请求
+            return False
+        return True
+
+    def record_success(self):
+        self.fail_count = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.fail_count += 1
+        if self.fail_count >= self.fail_max:
+            if self.opened_at is None:
+                logging.warning("Circuit breaker '%s' opened.", self.name)
+            self.opened_at = time.monotonic()
+
+
+GOOGLE_BREAKER = CircuitBreaker("google")
+YI_BREAKER = CircuitBreaker("yi")
+
+# 对冲模式：同时调用两家提供商，取最先成功的回复（花费翻倍，换 p99 延迟减半）
+HEDGE_PROVIDERS = os.getenv("HEDGE_PROVIDERS", "false").lower() in ("1", "true", "yes")
+
+# 各提供商最近 50 次成功调用的耗时，用于观察哪家更快
+PROVIDER_LATENCIES = {
+    "google": deque(maxlen=50),
+    "yi": deque(maxlen=50),
+}
+
+# 对限流和 5xx 状态码重试，其余状态码直接返回
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+# 每个上游主机预热的连接数
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+
+
+async def warm_up_connections():
+    """
+    对上游主机各发几个 HEAD 请求填充连接池。状态码无所谓，
+    只要完成握手，连接就以 keep-alive 留在池里供真实请求复用。
+    """
+    async def ping(host):
+        try:
+            await CLIENT.head(host, timeout=5)
+        except httpx.HTTPError:
+            # 预热失败不影响启动
+            logging.debug("Connection warm-up to %s failed.", host)
+
+    hosts = ("https://generativelanguage.googleapis.com/", "https://api.lingyiwanwu.com/")
+    await asyncio.gather(*(ping(host) for host in hosts for _ in range(WARMUP_CONNECTIONS)))
+    logging.info("Upstream connection warm-up finished.")
+
+
+async def post_with_retry(url, headers, content, retries=3, backoff_factor=0.3):
+    """
+    带抖动指数退避的 POST：只对 RETRY_STATUS_CODES 重试，
+    优先遵循上游返回的 Retry-After。
+    """
+    for attempt in range(retries + 1):
+        response = await CLIENT.post(url, headers=headers, content=content)
+        if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+            return response
+        # 指数退避加随机抖动，避免重试请求同时涌向上游
+        delay = backoff_factor * (2 ** attempt) * (1 + random.random())
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+        logging.warning("Upstream returned %d, retrying in %.2fs (attempt %d/%d)",
+                        response.status_code, delay, attempt + 1, retries)
+        await asyncio.sleep(delay)
+    return response
+
+
+def cache_key(provider, prompt):
+    """
+    根据提供商和提示内容生成缓存键。接受 str 或已编码的 bytes，
+    传 bytes 时不再重复做 UTF-8 编码。
+    """
+    if isinstance(prompt, str):
+        prompt = prompt.encode()
+    return f"{provider}:{hashlib.sha256(prompt).hexdigest()}"
+
 
 def extract_text(response_data):
     """
@@ -83,106 +314,340 @@ def extract_text(response_data):
 def generate_prompt(user_input, role=default_role, history=None):
     """
     生成发送到 API 的提示，包括对话历史。
+    注意：不修改传入的 history，只追加新轮次，保证已提交的前缀字节稳定，
+    便于命中提供商的 KV 前缀缓存。
     """
     if history is None:
         history = []
     conversation_history = history + [f"User: {user_input}"]
-    prompt = f"{role}\n" + "\n".join(conversation_history) + "\nAssistant:"
-    logging.info(f"Generated prompt: {prompt}")
+    role_prefix = default_role_prefix if role is default_role else role + "\n"
+    prompt = role_prefix + "\n".join(conversation_history) + "\nAssistant:"
+    # 完整提示只在 DEBUG 级别记录摘要，避免每轮把整段历史写进日志
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Generated prompt: len=%d hash=%s", len(prompt),
+                      hashlib.blake2b(prompt.encode(), digest_size=8).hexdigest())
     return prompt, conversation_history
 
 
-def call_google_api(prompt):
+def build_messages(user_input, role=default_role, history=None):
+    """
+    把对话历史转换为有序的 messages 列表：稳定的 system 前缀在最前，
+    历史轮次按原顺序排列，新输入追加在最后。
+    """
+    if history is None:
+        history = []
+    messages = [{"role": "system", "content": role}]
+    for turn in history:
+        if turn.startswith("Assistant: "):
+            messages.append({"role": "assistant", "content": turn[len("Assistant: "):]})
+        elif turn.startswith("User: "):
+            messages.append({"role": "user", "content": turn[len("User: "):]})
+        else:
+            messages.append({"role": "user", "content": turn})
+    messages.append({"role": "user", "content": user_input})
+    return messages
+
+
+async def call_google_api(prompt):
     """
     调用 Google API 发送生成的提示。
     """
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{default_model}:generateContent?key={gemini_key}"
-    headers = {'Content-Type': 'application/json'}
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    # 提示文本只编码一次：编码结果同时用作缓存键和请求体的片段
+    prompt_json = orjson.dumps(prompt)
+    _key = cache_key("google", prompt_json)
+    cached = RESPONSE_CACHE.get(_key)
+    if cached is not None:
+        logging.info("Google API cache hit.")
+        return cached, None
+
+    # 熔断器打开时直接短路，不再等待一次完整的上游超时
+    if GOOGLE_BREAKER.is_open():
+        logging.warning("Google API circuit breaker is open, skipping call.")
+        return "I'm sorry, I couldn't process your request at the moment. Please try again later.", "google circuit open"
+
+    payload = {"contents": [{"parts": [{"text": orjson.Fragment(prompt_json)}]}]}
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
+        start = time.perf_counter()
+        async with UPSTREAM_SEMAPHORE:
+            response = await post_with_retry(GOOGLE_URL, GOOGLE_HEADERS, orjson.dumps(payload))
         response.raise_for_status()  # 如果响应状态码不是 200，则抛出异常
+        PROVIDER_LATENCIES["google"].append(time.perf_counter() - start)
         logging.info("Google API call successful.")
-        return extract_text(response.json()), None
-    except requests.exceptions.RequestException as e:
+        GOOGLE_BREAKER.record_success()
+        text = extract_text(orjson.loads(response.content))
+        RESPONSE_CACHE[_key] = text
+        return text, None
+    except httpx.HTTPError as e:
+        GOOGLE_BREAKER.record_failure()
         logging.error(f"Request to Google API failed: {str(e)}")
         return "I'm sorry, I couldn't process your request at the moment. Please try again later.", str(e)
 
 
-def call_Yi_api(prompt):
+async def call_Yi_api(prompt, messages=None):
     """
     调用零一万物 API 发送生成的提示。
+    优先使用结构化的 messages 列表（稳定前缀利于提供商缓存），
+    没有提供时退回单条 user 消息。
     """
-    url = "https://api.lingyiwanwu.com/v1/chat/completions"
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {yi_key}'  # 从环境变量中获取 YI_KEY
-    }
+    if messages is None:
+        messages = [{"role": "user", "content": prompt}]
+    _key = cache_key("yi", prompt)
+    cached = RESPONSE_CACHE.get(_key)
+    if cached is not None:
+        logging.info("Lingyiwanwu API cache hit.")
+        return cached, None
+
+    # 熔断器打开时直接短路，不再等待一次完整的上游超时
+    if YI_BREAKER.is_open():
+        logging.warning("Lingyiwanwu API circuit breaker is open, skipping call.")
+        return "I'm sorry, I couldn't process your request at the moment. Please try again later.", "yi circuit open"
+
     payload = {
         "model": "yi-large",
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": messages,
         "temperature": 0.3
     }
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
+        start = time.perf_counter()
+        async with UPSTREAM_SEMAPHORE:
+            response = await post_with_retry(YI_URL, YI_HEADERS, orjson.dumps(payload))
         response.raise_for_status()  # 如果响应状态码不是 200，则抛出异常
+        PROVIDER_LATENCIES["yi"].append(time.perf_counter() - start)
         logging.info("Lingyiwanwu API call successful.")
-        return extract_text(response.json()), None
-    except requests.exceptions.RequestException as e:
+        YI_BREAKER.record_success()
+        text = extract_text(orjson.loads(response.content))
+        RESPONSE_CACHE[_key] = text
+        return text, None
+    except httpx.HTTPError as e:
+        YI_BREAKER.record_failure()
         logging.error(f"Request to Lingyiwanwu API failed: {str(e)}")
         return "I'm sorry, I couldn't process your request at the moment. Please try again later.", str(e)
 
 
-def process_chat(user_input, role=default_role, history=None):
+async def stream_Yi_api(messages):
+    """
+    以流式方式调用零一万物 API，逐块产出模型生成的文本，
+    避免等待完整回复后再返回给客户端。
+    """
+    payload = {
+        "model": "yi-large",
+        "messages": messages,
+        "temperature": 0.3,
+        "stream": True
+    }
+
+    async with UPSTREAM_SEMAPHORE:
+        async with CLIENT.stream("POST", YI_URL, headers=YI_HEADERS, content=orjson.dumps(payload)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                chunk = line[len("data: "):]
+                if chunk == "[DONE]":
+                    break
+                try:
+                    delta = orjson.loads(chunk)['choices'][0].get('delta', {})
+                except (ValueError, KeyError, IndexError):
+                    logging.warning(f"Skipping malformed stream chunk: {chunk}")
+                    continue
+                text = delta.get('content')
+                if text:
+                    yield text
+
+
+@app.post('/chat/stream')
+async def chat_stream(req: ChatRequest):
+    """
+    流式聊天接口：以 SSE 逐块推送模型回复，最后推送完整回复和 [DONE]。
+    """
+    user_input = req.message
+    role = req.role
+
+    # 会话模式：带 session_id 时历史存在服务端
+    if req.use_session():
+        session_id = req.session_id or uuid.uuid4().hex
+        history = await load_session(session_id)
+    else:
+        session_id = None
+        history = req.conversation_history
+
+    logging.debug("Received user input (stream): len=%d", len(user_input))
+    history = await compact_history(history)
+    messages = build_messages(user_input, role, history)
+
+    async def event_generator():
+        chunks = []
+        try:
+            async for text in stream_Yi_api(messages):
+                chunks.append(text)
+                yield b'data: ' + orjson.dumps({'delta': text}) + b'\n\n'
+        except httpx.HTTPError as e:
+            logging.error(f"Streaming request to Lingyiwanwu API failed: {str(e)}")
+            yield b'data: ' + orjson.dumps({'error': str(e)}) + b'\n\n'
+            return
+        bot_reply = "".join(chunks)
+        logging.info("chat stream finished reply_len=%d", len(bot_reply))
+        final = {'reply': bot_reply}
+        if session_id is not None:
+            await save_session(session_id, history + [f"User: {user_input}", f"Assistant: {bot_reply}"])
+            final['session_id'] = session_id
+        yield b'data: ' + orjson.dumps(final) + b'\n\n'
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
+# 历史超过这个字符数就压缩，保证每轮请求的 token 数有上界
+MAX_HISTORY_CHARS = int(os.getenv("MAX_HISTORY_CHARS", "8000"))
+RECENT_TURNS_KEPT = 8
+
+
+async def compact_history(history):
+    """
+    压缩超长的对话历史：保留最近 RECENT_TURNS_KEPT 轮原文，
+    更早的轮次用一次（可缓存的）模型调用压缩成一条摘要，
+    摘要放在最近轮次之前以保持前缀稳定。
+    """
+    if not history or sum(len(t) for t in history) <= MAX_HISTORY_CHARS:
+        return history
+    old, recent = history[:-RECENT_TURNS_KEPT], history[-RECENT_TURNS_KEPT:]
+    if not old:
+        return history
+
+    summary_prompt = ("Summarize the following conversation in a few sentences, "
+                      "keeping every detail needed to continue it:\n" + "\n".join(old))
+    summary, error = await call_Yi_api(summary_prompt)
+    if error:
+        # 摘要失败时退化为直接丢弃旧轮次
+        logging.warning("History summarization failed, truncating old turns instead.")
+        return recent
+    logging.info("Compacted %d old turns into a summary of %d chars.", len(old), len(summary))
+    return [f"Summary of earlier conversation: {summary}"] + recent
+
+
+async def call_with_hedging(prompt, messages):
+    """
+    同时调用两家提供商，返回最先成功的回复并取消另一个请求。
+    两家都失败时返回最后一个错误。
+    """
+    pending = {
+        asyncio.create_task(call_Yi_api(prompt, messages)),
+        asyncio.create_task(call_google_api(prompt)),
+    }
+    bot_reply, error = None, None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            bot_reply, error = task.result()
+            if error is None:
+                for p in pending:
+                    p.cancel()
+                return bot_reply, None
+    return bot_reply, error
+
+
+async def process_chat(user_input, role=default_role, history=None):
     """
     处理聊天请求：生成提示并调用 API。
     """
+    history = await compact_history(history)
     prompt, conversation_history = generate_prompt(user_input, role, history)
-
-    # 这里可以灵活选择调用 Google API 或 Lingyiwanwu API
-    # bot_reply, error = call_google_api(prompt)
-    bot_reply, error = call_Yi_api(prompt)
+    messages = build_messages(user_input, role, history)
+
+    if HEDGE_PROVIDERS:
+        # 对冲模式：两家同时调用，谁先成功用谁
+        bot_reply, error = await call_with_hedging(prompt, messages)
+    else:
+        # 这里可以灵活选择调用 Google API 或 Lingyiwanwu API
+        bot_reply, error = await call_Yi_api(prompt, messages)
+        if error:
+            # 主提供商失败（含熔断打开）时回退到另一家
+            logging.warning("Lingyiwanwu API unavailable, falling back to Google API.")
+            bot_reply, error = await call_google_api(prompt)
 
     if error:
         logging.error(f"Error in processing chat: {error}")
         return bot_reply, conversation_history, error
 
     conversation_history.append(f"Assistant: {bot_reply}")
-    logging.info(f"Assistant reply: {bot_reply}")
+    logging.debug("Assistant reply: len=%d", len(bot_reply))
     return bot_reply, conversation_history, None
 
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    data = request.json
+@app.post('/chat')
+async def chat(req: ChatRequest):
+    user_input = req.message
+    role = req.role
 
-    # 从请求中提取用户输入、角色和历史记录
-    user_input = data.get('message', "")
-    role = data.get('role', default_role)
-    history = data.get('conversation_history', [])
+    # 会话模式：带 session_id 时历史存在服务端，响应不再回传整个历史
+    if req.use_session():
+        session_id = req.session_id or uuid.uuid4().hex
+        history = await load_session(session_id)
+    else:
+        session_id = None
+        history = req.conversation_history
 
-    logging.info(f"Received user input: {user_input}")
+    logging.debug("Received user input: len=%d", len(user_input))
 
     # 处理聊天请求
-    bot_reply, updated_history, error = process_chat(user_input, role, history)
+    start = time.perf_counter()
+    bot_reply, updated_history, error = await process_chat(user_input, role, history)
+    # 每个请求只留一行 INFO：耗时和输入/输出长度
+    logging.info("chat handled in %.3fs input_len=%d reply_len=%d error=%s",
+                 time.perf_counter() - start, len(user_input), len(bot_reply), bool(error))
 
     if error:
-        return jsonify({"error": error, "message": bot_reply}), 500
+        return ORJSONResponse({"error": error, "message": bot_reply}, status_code=500)
+
+    if session_id is not None:
+        await save_session(session_id, updated_history)
+        return ORJSONResponse({
+            "reply": bot_reply,
+            "session_id": session_id
+        }, status_code=200)
 
-    return jsonify({
+    return ORJSONResponse({
         "reply": bot_reply,
         "conversation_history": updated_history
-    }), 200
+    }, status_code=200)
 
 
-@app.route('/')
-def home():
+@app.get('/stats')
+async def stats():
+    """
+    各提供商最近 50 次成功调用的延迟分布和熔断器状态，
+    用于判断哪家更快、是否值得打开对冲模式。
+    """
+    breakers = {"google": GOOGLE_BREAKER, "yi": YI_BREAKER}
+
+    def summarize(name):
+        samples = sorted(PROVIDER_LATENCIES[name])
+        summary = {
+            "samples": len(samples),
+            "circuit_open": breakers[name].is_open(),
+        }
+        if samples:
+            summary["median_s"] = round(samples[len(samples) // 2], 3)
+            summary["p95_s"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3)
+        return summary
+
+    return ORJSONResponse({
+        "providers": {name: summarize(name) for name in PROVIDER_LATENCIES},
+        "hedging_enabled": HEDGE_PROVIDERS
+    })
+
+
+@app.get('/')
+async def home():
     logging.info("Home route accessed.")
-    return "Welcome to my Flask App!"
+    return "Welcome to my FastAPI App!"
 
 
 if __name__ == '__main__':
-    logging.info("Starting Flask application...")
-    app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
+    # 仅用于本地调试；生产环境用多 worker 的 uvicorn 启动（见 Dockerfile）
+    import uvicorn
+
+    logging.info("Starting FastAPI application...")
+    uvicorn.run(app, host='0.0.0.0', port=8080)